@@ -0,0 +1,90 @@
+# _topk_cosine.py
+import numpy as np
+from numba import get_num_threads, njit, prange
+
+EMB_DIM = 384  # all-MiniLM-L6-v2 output size; gets a kernel with a constant loop bound
+
+@njit(cache=True)
+def _sift_down(heap_s, heap_i, size):
+    # restore the min-heap property after replacing the root
+    pos = 0
+    while True:
+        child = 2 * pos + 1
+        if child >= size:
+            break
+        if child + 1 < size and heap_s[child + 1] < heap_s[child]:
+            child += 1
+        if heap_s[pos] <= heap_s[child]:
+            break
+        heap_s[pos], heap_s[child] = heap_s[child], heap_s[pos]
+        heap_i[pos], heap_i[child] = heap_i[child], heap_i[pos]
+        pos = child
+
+@njit(cache=True)
+def _push(best_s, best_i, s, i, k):
+    # keep the k largest scores seen so far; best_s[0] is the smallest of them
+    if s > best_s[0]:
+        best_s[0] = s
+        best_i[0] = i
+        _sift_down(best_s, best_i, k)
+
+def _make_topk(dim):
+    """
+    Generate a fused dot-product + top-k kernel. A positive `dim` is a closure
+    variable numba freezes as a compile-time constant, so LLVM can fully unroll and
+    vectorize the inner dot product; dim=0 reads the width from `mat` at run time.
+    """
+    # not cached on disk: kernels from one factory share a qualname and source line,
+    # which numba's cache cannot tell apart. MiniRAG warms them up at startup instead.
+    @njit(fastmath=True, parallel=True)
+    def kernel(mat, qs, k):
+        n = mat.shape[0]
+        d = dim if dim > 0 else mat.shape[1]
+        nq = qs.shape[0]
+
+        # split the rows into one block per thread, each with its own heap, so a
+        # single query still uses every core; the per-block heaps are merged below
+        n_blocks = max(1, min(get_num_threads(), n))
+        block = (n + n_blocks - 1) // n_blocks
+        cand_s = np.full((nq, n_blocks, k), -1e30, dtype=np.float32)
+        cand_i = np.full((nq, n_blocks, k), -1, dtype=np.int64)
+
+        for t in prange(nq * n_blocks):
+            b = t // n_blocks
+            blk = t % n_blocks
+            q = qs[b]
+            best_s = cand_s[b, blk]
+            best_i = cand_i[b, blk]
+            for i in range(blk * block, min(n, (blk + 1) * block)):
+                s = 0.0
+                for j in range(d):
+                    s += mat[i, j] * q[j]
+                _push(best_s, best_i, s, i, k)
+
+        out_s = np.empty((nq, k), dtype=np.float32)
+        out_i = np.empty((nq, k), dtype=np.int64)
+        for b in range(nq):
+            flat_s = cand_s[b].reshape(-1)
+            flat_i = cand_i[b].reshape(-1)
+            order = np.argsort(-flat_s)
+            for r in range(k):
+                out_s[b, r] = flat_s[order[r]]
+                out_i[b, r] = flat_i[order[r]]
+
+        return out_s, out_i
+
+    return kernel
+
+_topk_cos_any = _make_topk(0)
+_topk_cos_fixed = _make_topk(EMB_DIM)
+
+def topk_cos(mat, qs, k):
+    """
+    Fused dot-product + top-k over unit-length rows of `mat` for each query row in `qs`.
+    Keeps k-sized min-heaps per query and row block instead of materializing the full
+    score vector.
+    Returns (scores, idxs), each of shape (n_queries, k), best first.
+    """
+    if mat.shape[1] == EMB_DIM and qs.shape[1] == EMB_DIM:
+        return _topk_cos_fixed(mat, qs, k)
+    return _topk_cos_any(mat, qs, k)
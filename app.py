@@ -1,18 +1,28 @@
 # app.py
 import os
+import asyncio
 import logging
+from collections import deque
 from telegram import Update
+from telegram.error import RetryAfter, TelegramError
 from telegram.ext import ApplicationBuilder, CommandHandler, ContextTypes
 from dotenv import load_dotenv
-from rag import MiniRAG
 
+# load .env before importing rag: its OLLAMA_* / RETRIEVAL_BACKEND settings are read at import
 load_dotenv()
+from rag import MiniRAG
+
 TG_TOKEN = os.getenv("TG_TOKEN")
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-user_history = {}
+user_history = {}  # user id -> deque of (who, text), capped at HISTORY_SIZE
+HISTORY_SIZE = 10
+
+BATCH_WINDOW = 0.01  # seconds to wait for more queries before encoding a batch
+BATCH_MAX_SIZE = 32
+STREAM_EDIT_INTERVAL = 0.3  # seconds between message edits while an answer streams in
 
 try:
     rag = MiniRAG()
@@ -20,6 +30,123 @@ except Exception as e:
     print("Error initializing MiniRAG:", e)
     raise
 
+class QueryBatcher:
+    """
+    Coalesces concurrent /ask queries so their embeddings are computed in one
+    model.encode call. Each submit() resolves to the retrieved chunks for its own query;
+    answers are then generated per query so they can be streamed back independently.
+    """
+    def __init__(self, rag, window=BATCH_WINDOW, max_size=BATCH_MAX_SIZE):
+        self.rag = rag
+        self.window = window
+        self.max_size = max_size
+        self._queue = None
+        self._worker = None
+
+    async def submit(self, query):
+        if self._worker is None:
+            # created lazily so the queue and task bind to the bot's running loop
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+        fut = asyncio.get_running_loop().create_future()
+        await self._queue.put((query, fut))
+        return await fut
+
+    async def close(self):
+        """Stop the worker task; safe to call if it never started."""
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+
+    async def _collect(self):
+        batch = [await self._queue.get()]
+        deadline = asyncio.get_running_loop().time() + self.window
+        while len(batch) < self.max_size:
+            timeout = deadline - asyncio.get_running_loop().time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            queries = [q for q, _ in batch]
+            try:
+                # encoding + scoring is CPU/GPU bound: keep it off the event loop
+                retrieved = await asyncio.to_thread(self.rag.retrieve_batch, queries)
+            except Exception as e:
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+
+            for (_, fut), results in zip(batch, retrieved):
+                if not fut.done():
+                    fut.set_result(results)
+
+batcher = QueryBatcher(rag)
+
+def retry_after_seconds(e):
+    # newer python-telegram-bot releases report retry_after as a timedelta
+    delay = e.retry_after
+    return delay.total_seconds() if hasattr(delay, "total_seconds") else float(delay)
+
+async def edit_quietly(message, text, attempts=3):
+    """
+    Edit `message`, waiting out Telegram flood control (RetryAfter) between attempts.
+    Other Telegram errors are logged, never raised. Returns True if the edit went through.
+    """
+    for _ in range(attempts):
+        try:
+            await message.edit_text(text)
+            return True
+        except RetryAfter as e:
+            await asyncio.sleep(retry_after_seconds(e))
+        except TelegramError as e:
+            logger.warning("edit_text failed: %s", e)
+            return False
+    return False
+
+async def stream_reply(message, chunks):
+    """
+    Show a streamed answer by editing `message` at most every STREAM_EDIT_INTERVAL
+    seconds. Telegram send failures are handled here; only errors from `chunks`
+    propagate. Returns the final text.
+    """
+    loop = asyncio.get_running_loop()
+    shown = message.text
+    next_edit = loop.time() + STREAM_EDIT_INTERVAL
+    text = shown
+    async for text in chunks:
+        if not text or text == shown or loop.time() < next_edit:
+            continue
+        try:
+            await message.edit_text(text)
+            shown = text
+            next_edit = loop.time() + STREAM_EDIT_INTERVAL
+        except RetryAfter as e:
+            # flood control: keep reading the stream, hold edits until the ban lifts
+            next_edit = loop.time() + retry_after_seconds(e)
+        except TelegramError as e:
+            logger.debug("edit_text failed: %s", e)
+            next_edit = loop.time() + STREAM_EDIT_INTERVAL
+
+    if text and text != shown:
+        delay = next_edit - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await edit_quietly(message, text)
+    return text
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("Mini-RAG (Ollama) bot ready. Use /ask <query>.")
 
@@ -33,38 +160,48 @@ async def ask_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Usage: /ask <your question>")
         return
 
-    uid = str(update.message.from_user.id)
-    user_history.setdefault(uid, []).append(("user", query))
-    if len(user_history[uid]) > 10:
-        user_history[uid] = user_history[uid][-10:]
+    uid = update.message.from_user.id
+    history = user_history.setdefault(uid, deque(maxlen=HISTORY_SIZE))
+    history.append(("user", query))
 
+    # reply right away, then fill the message in as the answer is generated
+    reply = await update.message.reply_text("🔎 Searching the documents...")
     try:
-        answer = rag.ask(query)
+        retrieved = await batcher.submit(query)
+        answer = await stream_reply(reply, rag.astream(query, retrieved=retrieved))
     except Exception as e:
         logger.exception("RAG error: %s", e)
         answer = "Sorry — an internal error occurred."
+        await edit_quietly(reply, answer)
 
-    user_history[uid].append(("bot", answer))
-    if len(user_history[uid]) > 10:
-        user_history[uid] = user_history[uid][-10:]
-
-    await update.message.reply_text(answer)
+    history.append(("bot", answer))
 
 async def summarize_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    uid = str(update.message.from_user.id)
-    history = user_history.get(uid, [])
+    uid = update.message.from_user.id
+    history = user_history.get(uid, ())
     user_msgs = [t for who,t in history if who == "user"][-3:]
     if not user_msgs:
         await update.message.reply_text("No recent queries found.")
         return
     await update.message.reply_text("Your last queries:\n- " + "\n- ".join(user_msgs))
 
+async def shutdown(app):
+    await batcher.close()
+    await rag.aclose()
+
 def main():
     if not TG_TOKEN:
         print("❌ You must set TG_TOKEN in .env file")
         return
 
-    app = ApplicationBuilder().token(TG_TOKEN).build()
+    # concurrent_updates lets several /ask handlers wait on the batcher at once
+    app = (
+        ApplicationBuilder()
+        .token(TG_TOKEN)
+        .concurrent_updates(True)
+        .post_shutdown(shutdown)
+        .build()
+    )
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("help", help_cmd))
     app.add_handler(CommandHandler("ask", ask_cmd))
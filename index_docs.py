@@ -1,19 +1,28 @@
 # index_docs.py
 import os
 import sqlite3
-import hashlib
 import numpy as np
+import xxhash
 from sentence_transformers import SentenceTransformer
-from tqdm import tqdm
+from rag import blob_to_emb, pick_device
 
 DOCS_FOLDER = "docs"
 DB_PATH = "embeddings.db"
+VECTORS_PATH = "embeddings.npy"  # normalized float32 matrix, row order = chunks.id
 MODEL_NAME = "all-MiniLM-L6-v2"
 
 CHUNK_SIZE = 400
 CHUNK_OVERLAP = 100
+ENCODE_BATCH_SIZE = 64
 
-model = SentenceTransformer(MODEL_NAME)
+DEVICE = pick_device()
+model = SentenceTransformer(MODEL_NAME, device=DEVICE)
+if DEVICE == "cuda":
+    model.half()
+
+def chunk_hash(fn, idx, chunk):
+    # dedup key, not a security boundary: xxh3 is much cheaper than sha256
+    return xxhash.xxh3_128_hexdigest(f"{fn}{idx}{chunk[:64]}".encode())
 
 def ensure_db(conn):
     conn.execute("""
@@ -23,22 +32,67 @@ def ensure_db(conn):
             chunk_index INTEGER,
             text TEXT,
             emb BLOB,
-            chunk_hash TEXT UNIQUE
+            chunk_hash TEXT UNIQUE,
+            dim INTEGER,
+            dtype TEXT
         )
     """)
+    # older databases predate the dim/dtype columns; their rows are float32
+    cols = {row[1] for row in conn.execute("PRAGMA table_info(chunks)")}
+    if "dim" not in cols:
+        conn.execute("ALTER TABLE chunks ADD COLUMN dim INTEGER")
+    if "dtype" not in cols:
+        conn.execute("ALTER TABLE chunks ADD COLUMN dtype TEXT")
+
+    # rekey rows hashed with sha256 (64 hex chars) so they still dedup against new keys
+    legacy = conn.execute(
+        "SELECT id, doc_name, chunk_index, text FROM chunks WHERE length(chunk_hash) = 64"
+    ).fetchall()
+    if legacy:
+        conn.executemany(
+            "UPDATE chunks SET chunk_hash=? WHERE id=?",
+            ((chunk_hash(doc, idx, text), rid) for rid, doc, idx, text in legacy),
+        )
     conn.commit()
 
 def chunk_text(text):
-    chunks = []
-    i = 0
-    while i < len(text):
-        chunk = text[i:i+CHUNK_SIZE]
-        chunks.append(chunk.strip())
-        i += CHUNK_SIZE - CHUNK_OVERLAP
+    step = CHUNK_SIZE - CHUNK_OVERLAP
+    chunks = (text[s:s+CHUNK_SIZE].strip() for s in range(0, len(text), step))
     return [c for c in chunks if c]
 
 def emb_to_blob(vec):
-    return vec.astype("float32").tobytes()
+    """
+    Quantize an embedding to int8 with a per-vector scale.
+    Blob layout: float32 scale followed by dim int8 values (vec ~= int8 * scale).
+    """
+    vec = vec.astype("float32")
+    vec /= np.linalg.norm(vec) + 1e-12
+    scale = np.float32(max(float(np.max(np.abs(vec))), 1e-12) / 127)
+    qi8 = np.round(vec / scale).astype(np.int8)
+    return scale.tobytes() + qi8.tobytes()
+
+def existing_hashes(conn, hashes):
+    """Return the subset of `hashes` already stored, in a few IN (...) queries."""
+    found = set()
+    hashes = list(hashes)
+    for i in range(0, len(hashes), 500):  # stay under SQLite's bound-variable limit
+        part = hashes[i:i+500]
+        placeholders = ",".join("?" * len(part))
+        rows = conn.execute(f"SELECT chunk_hash FROM chunks WHERE chunk_hash IN ({placeholders})", part)
+        found.update(r[0] for r in rows)
+    return found
+
+def export_vectors(conn):
+    """
+    Dump every embedding as one contiguous, L2-normalized float32 matrix ordered by id,
+    so MiniRAG can mmap it at startup instead of decoding BLOBs row by row.
+    """
+    rows = conn.execute("SELECT emb, dtype FROM chunks ORDER BY id").fetchall()
+    if not rows:
+        return
+    arr = np.vstack([blob_to_emb(blob, dtype) for blob, dtype in rows]).astype(np.float32)
+    arr /= np.linalg.norm(arr, axis=1, keepdims=True) + 1e-12
+    np.save(VECTORS_PATH, arr)
 
 def index_docs():
     print("📄 Starting document indexing...")
@@ -55,8 +109,16 @@ def index_docs():
         return
 
     conn = sqlite3.connect(DB_PATH)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
     ensure_db(conn)
 
+    # one write transaction for the whole run instead of per-statement round-trips
+    conn.execute("BEGIN IMMEDIATE")
+
+    # pass 1: chunk every document and keep only chunks not already indexed
+    todo = []
     for fn in files:
         path = os.path.join(DOCS_FOLDER, fn)
         with open(path, "r", encoding="utf-8") as f:
@@ -64,20 +126,35 @@ def index_docs():
         chunks = chunk_text(raw)
         print(f"Indexing {fn} ({len(chunks)} chunks)")
 
-        for idx, chunk in enumerate(tqdm(chunks)):
-            chash = hashlib.sha256((fn + str(idx) + chunk[:64]).encode()).hexdigest()
-
-            cur = conn.execute("SELECT 1 FROM chunks WHERE chunk_hash=?", (chash,))
-            if cur.fetchone():
-                continue
+        keyed = [
+            (fn, idx, chunk, chunk_hash(fn, idx, chunk))
+            for idx, chunk in enumerate(chunks)
+        ]
+        seen = existing_hashes(conn, (chash for _, _, _, chash in keyed))
+        todo.extend(item for item in keyed if item[3] not in seen)
 
-            emb = model.encode(chunk)
-            conn.execute(
-                "INSERT INTO chunks (doc_name, chunk_index, text, emb, chunk_hash) VALUES (?, ?, ?, ?, ?)",
-                (fn, idx, chunk, emb_to_blob(emb), chash)
-            )
+    # pass 2: encode all new chunks in batches and insert them together
+    if todo:
+        embs = model.encode(
+            [chunk for _, _, chunk, _ in todo],
+            batch_size=ENCODE_BATCH_SIZE,
+            show_progress_bar=True,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+        )
+        conn.executemany(
+            "INSERT OR IGNORE INTO chunks (doc_name, chunk_index, text, emb, chunk_hash, dim, dtype) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                (fn, idx, chunk, emb_to_blob(emb), chash, len(emb), "int8")
+                for (fn, idx, chunk, chash), emb in zip(todo, embs)
+            ),
+        )
+    print(f"{len(todo)} new chunks embedded")
 
     conn.commit()
+    # fold the WAL back into embeddings.db first, so the .npy dump ends up newer than the DB file
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    export_vectors(conn)
     conn.close()
     print("Indexing complete! embeddings.db created.")
 
@@ -1,74 +1,327 @@
 # rag.py
 import os
+import json
+import asyncio
 import sqlite3
+import threading
+from collections import OrderedDict
+import httpx
 import numpy as np
 import requests
+import torch
+import xxhash
 from sentence_transformers import SentenceTransformer
-from sklearn.neighbors import NearestNeighbors
+
+try:
+    import simsimd  # optional: SIMD cosine kernels, falls back to numpy matmul
+except ImportError:
+    simsimd = None
+
+try:
+    from _topk_cosine import topk_cos  # optional: needs numba
+except ImportError:
+    topk_cos = None
+
+try:
+    import faiss  # optional: HNSW graph index for large corpora
+except ImportError:
+    faiss = None
 
 # --- Configuration ---
 DB_PATH = "embeddings.db"
+VECTORS_PATH = "embeddings.npy"  # written by index_docs.py alongside the DB
+FAISS_PATH = "embeddings.faiss"  # HNSW index cache, rebuilt when the DB is newer
 EMB_MODEL = "all-MiniLM-L6-v2"
 TOP_K = 3  # retrieval candidate count (we will pass only top_n to the LLM)
+QUERY_CACHE_SIZE = 1024  # max cached retrieval results
+ANSWER_CACHE_SIZE = 512  # max cached LLM answers
 OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")
 OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "phi3:mini")  # override in .env if needed
 OLLAMA_TIMEOUT = int(os.getenv("OLLAMA_TIMEOUT", "30"))  # seconds
+RETRIEVAL_BACKEND = os.getenv("RETRIEVAL_BACKEND", "auto")  # auto | faiss | numba | simsimd | numpy
+FAISS_MIN_CHUNKS = 10000  # below this, "auto" keeps exact brute-force search
+HNSW_M = 32  # graph neighbors per node
+HNSW_EF_SEARCH = 64  # search breadth; higher = better recall, slower queries
+
+# Static instructions are built once; only {context} and {query} change per call.
+# Keeping the prefix byte-identical across requests also lets Ollama reuse its prompt cache.
+PROMPT_TEMPLATE = (
+    "You are a precise assistant. Use ONLY the provided document snippets below and nothing else.\n\n"
+    "Context:\n{context}\n\n"
+    "Question: {query}\n\n"
+    "Answer VERY CONCISELY in 1 or 2 short sentences, only using facts supported by the snippets. "
+    "Do NOT add any information that is not present. "
+    "If the answer is not present in the snippets, reply exactly: \"I couldn't find the answer in the documents.\" "
+    "At the end, append a single 'Sources:' line listing the snippet headers you used (comma-separated), e.g. Sources: doc1.md#chunk0.\n"
+)
+
+def blob_to_emb(blob, dtype):
+    """
+    Decode an embedding BLOB written by index_docs.emb_to_blob.
+    Rows indexed before quantization have no dtype and hold raw float32.
+    """
+    if dtype == "int8":
+        scale = np.frombuffer(blob, dtype=np.float32, count=1)[0]
+        return np.frombuffer(blob, dtype=np.int8, offset=4).astype(np.float32) * scale
+    return np.frombuffer(blob, dtype=np.float32)
+
+def quantize_i8(mat):
+    """
+    Per-row symmetric int8 quantization. Cosine similarity is scale-invariant,
+    so the int8 rows can be compared directly without their scales.
+    """
+    scales = np.maximum(np.max(np.abs(mat), axis=1, keepdims=True), 1e-12) / 127
+    return np.ascontiguousarray(np.round(mat / scales), dtype=np.int8)
+
+def normalize_query(query):
+    return query.strip().lower()
+
+def query_key(query):
+    """64-bit hash of the normalized query, used as a compact cache key."""
+    return xxhash.xxh3_64_intdigest(normalize_query(query).encode())
+
+class LRUCache:
+    """
+    Bounded mapping that evicts the least recently used entry. Thread-safe.
+    """
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+def pick_device():
+    """Prefer CUDA, then Apple MPS, then CPU for the embedding model."""
+    if torch.cuda.is_available():
+        return "cuda"
+    mps = getattr(torch.backends, "mps", None)
+    if mps is not None and mps.is_available():
+        return "mps"
+    return "cpu"
+
+def pick_backend(name, n_chunks):
+    """
+    Resolve the retrieval backend. "auto" uses FAISS HNSW once the corpus reaches
+    FAISS_MIN_CHUNKS, otherwise SimSIMD, then plain numpy. The numba kernel is opt-in
+    only: numpy's multi-threaded BLAS matmul is at least as fast in measurements so far.
+    """
+    available = {
+        "faiss": faiss is not None,
+        "numba": topk_cos is not None,
+        "simsimd": simsimd is not None,
+        "numpy": True,
+    }
+    if name == "auto":
+        if available["faiss"] and n_chunks >= FAISS_MIN_CHUNKS:
+            return "faiss"
+        return next(b for b in ("simsimd", "numpy") if available[b])
+    if not available.get(name):
+        raise RuntimeError(f"Retrieval backend {name!r} is not available (missing package?)")
+    return name
 
 # --- MiniRAG class ---
 class MiniRAG:
     def __init__(self):
-        # load embedding model
-        self.model = SentenceTransformer(EMB_MODEL)
+        # load embedding model (fp16 on CUDA; outputs are cast back to float32 for scoring)
+        device = pick_device()
+        self.model = SentenceTransformer(EMB_MODEL, device=device)
+        if device == "cuda":
+            self.model.half()
 
-        # simple in-memory cache
-        self._query_cache = {}
+        # bounded retrieval cache, keyed by query_key()
+        self._query_cache = LRUCache(QUERY_CACHE_SIZE)
+        # bounded LLM answer cache, keyed by _answer_key()
+        self._answer_cache = LRUCache(ANSWER_CACHE_SIZE)
 
         # verify DB exists
         if not os.path.exists(DB_PATH):
             raise RuntimeError(f"{DB_PATH} not found. Run index_docs.py first to create embeddings.db")
 
+        # shared keep-alive clients for Ollama (sync ask() and async astream());
+        # connections are opened lazily on first use and reused across calls
+        self._http = requests.Session()
+        self._ahttp = httpx.AsyncClient(timeout=OLLAMA_TIMEOUT)
+
         # connect and load index
         self.conn = sqlite3.connect(DB_PATH)
         self._load_index()
+        self.backend = pick_backend(RETRIEVAL_BACKEND, len(self.vectors))
+        self._prepare_backend()
 
     def _load_index(self):
-        rows = self.conn.execute("SELECT doc_name, chunk_index, text, emb FROM chunks").fetchall()
-        if not rows:
+        if not self._load_index_from_npy():
+            self._load_index_from_db()
+
+    def _prepare_backend(self):
+        """
+        Build whatever per-backend state retrieval needs on top of self.vectors.
+        """
+        # SimSIMD has int8 cosine kernels: a quarter of the memory traffic of float32
+        self.vectors_i8 = quantize_i8(self.vectors) if self.backend == "simsimd" else None
+        self.faiss_index = self._load_faiss_index() if self.backend == "faiss" else None
+
+        if self.backend == "numba":
+            # trigger JIT compilation now so the first real query doesn't pay for it; the
+            # dummy query must be writable like model.encode output (numba types differ)
+            topk_cos(self.vectors, np.zeros((1, self.vectors.shape[1]), dtype=np.float32), 1)
+
+    def _load_faiss_index(self):
+        """
+        Reuse the HNSW index persisted at FAISS_PATH if it is newer than the DB and
+        covers every chunk; otherwise build it from self.vectors and persist it.
+        Vectors are already L2-normalized, so inner product == cosine similarity.
+        """
+        index = None
+        if os.path.exists(FAISS_PATH) and os.path.getmtime(FAISS_PATH) >= os.path.getmtime(DB_PATH):
+            index = faiss.read_index(FAISS_PATH)
+            if index.ntotal != len(self.vectors) or index.d != self.vectors.shape[1]:
+                index = None
+
+        if index is None:
+            index = faiss.IndexHNSWFlat(self.vectors.shape[1], HNSW_M, faiss.METRIC_INNER_PRODUCT)
+            index.add(np.ascontiguousarray(self.vectors, dtype=np.float32))
+            faiss.write_index(index, FAISS_PATH)
+
+        index.hnsw.efSearch = max(HNSW_EF_SEARCH, TOP_K)
+        return index
+
+    def _load_index_from_npy(self):
+        """
+        Fast path: mmap the matrix dumped by index_docs.py and only fetch texts from SQLite.
+        Returns False if the dump is missing, older than the DB, or out of sync with it.
+        """
+        if not os.path.exists(VECTORS_PATH) or os.path.getmtime(VECTORS_PATH) < os.path.getmtime(DB_PATH):
+            return False
+        rows = self.conn.execute("SELECT doc_name, chunk_index, text FROM chunks ORDER BY id").fetchall()
+        vectors = np.load(VECTORS_PATH, mmap_mode="r")
+        if not rows or vectors.shape[0] != len(rows):
+            return False
+        self._set_chunk_meta(*zip(*rows))
+        self.vectors = vectors  # already normalized at index time
+        return True
+
+    def _set_chunk_meta(self, doc_names, chunk_idxs, chunk_texts):
+        # parallel per-chunk columns (row i matches self.vectors[i]); only read for the final top-k
+        self.doc_names = list(doc_names)
+        self.chunk_idxs = np.asarray(chunk_idxs, dtype=np.int32)
+        self.chunk_texts = list(chunk_texts)
+
+    def _load_index_from_db(self):
+        cols = {row[1] for row in self.conn.execute("PRAGMA table_info(chunks)")}
+        dtype_col = "dtype" if "dtype" in cols else "NULL"
+        n = self.conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+        if not n:
             raise RuntimeError("No embeddings found in DB. Did you run index_docs.py?")
 
-        self.texts = []
-        vectors = []
-        for doc, idx, text, emb_blob in rows:
-            self.texts.append((doc, idx, text))
-            vectors.append(np.frombuffer(emb_blob, dtype="float32"))
-        self.vectors = np.vstack(vectors)
+        # stream rows straight into a preallocated matrix: no list of arrays, no vstack copy
+        vectors = None
+        doc_names, chunk_idxs, chunk_texts = [], [], []
+        cur = self.conn.execute(f"SELECT doc_name, chunk_index, text, emb, {dtype_col} FROM chunks ORDER BY id")
+        for i, (doc, idx, text, emb_blob, dtype) in enumerate(cur):
+            emb = blob_to_emb(emb_blob, dtype)
+            if vectors is None:
+                vectors = np.empty((n, emb.shape[0]), dtype=np.float32)
+            vectors[i] = emb
+            doc_names.append(doc)
+            chunk_idxs.append(idx)
+            chunk_texts.append(text)
+        self._set_chunk_meta(doc_names, chunk_idxs, chunk_texts)
+        self.vectors = vectors
+
+        # L2-normalize once so cosine similarity is a plain dot product at query time
+        self.vectors /= np.linalg.norm(self.vectors, axis=1, keepdims=True) + 1e-12
+
+    def _scores(self, q_vecs):
+        """
+        Cosine similarity of each query row against every stored vector, shape (n_queries, n_chunks).
+        """
+        if self.vectors_i8 is not None:
+            dists = simsimd.cdist(quantize_i8(q_vecs), self.vectors_i8, metric="cosine")
+            return 1.0 - np.asarray(dists, dtype=np.float32)
+        return q_vecs @ self.vectors.T
+
+    def _top_k(self, q_vecs, k):
+        """
+        Score a 2D matrix of unit-length query vectors against the index.
+        Returns (scores, idxs), each of shape (n_queries, k), best first.
+        """
+        if self.backend == "numba":
+            return topk_cos(self.vectors, q_vecs, k)
+        if self.backend == "faiss":
+            # approximate: HNSW returns -1 ids if it finds fewer than k neighbors
+            return self.faiss_index.search(q_vecs, k)
 
-        # build nearest-neighbor index
-        n_neighbors = min(TOP_K, len(self.vectors))
-        self.nn = NearestNeighbors(n_neighbors=n_neighbors, metric="cosine")
-        self.nn.fit(self.vectors)
+        scores = self._scores(q_vecs)
+        idxs = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top = np.take_along_axis(scores, idxs, axis=1)
+        order = np.argsort(-top, axis=1)
+        return np.take_along_axis(top, order, axis=1), np.take_along_axis(idxs, order, axis=1)
 
     def retrieve(self, query):
         """
         Compute embedding for query, return top-k retrieved chunks sorted by score (best first).
         Results are dicts with keys: doc, chunk, score, text
         """
-        if query in self._query_cache:
-            return self._query_cache[query]
+        return self.retrieve_batch([query])[0]
 
-        q_vec = self.model.encode(query)
-        n_neighbors = min(TOP_K, len(self.vectors))
-        dists, idxs = self.nn.kneighbors([q_vec], n_neighbors=n_neighbors)
+    def retrieve_batch(self, queries):
+        """
+        Batched variant of retrieve(): encode all uncached queries in a single
+        model.encode call and score them against the index in one pass.
+        Returns one result list per query, in the same order as `queries`.
+        """
+        keys = [query_key(q) for q in queries]
+        found = {}
+        misses = {}
+        for query, key in zip(queries, keys):
+            hit = self._query_cache.get(key)
+            if hit is not None:
+                found[key] = hit
+            elif key not in misses:
+                misses[key] = normalize_query(query)
+
+        if misses:
+            q_vecs = self.model.encode(
+                list(misses.values()),
+                batch_size=len(misses),
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+            )
+            q_vecs = np.asarray(q_vecs, dtype=np.float32)
+            k = min(TOP_K, len(self.vectors))
+            scores, idxs = self._top_k(q_vecs, k)
 
-        results = []
-        for d, i in zip(dists[0], idxs[0]):
-            doc, idx, text = self.texts[i]
-            score = float(1 - d)
-            results.append({"doc": doc, "chunk": idx, "score": score, "text": text})
+            for key, row_scores, row_idxs in zip(misses, scores, idxs):
+                results = []
+                for s, i in zip(row_scores, row_idxs):
+                    if i < 0:
+                        continue
+                    results.append({
+                        "doc": self.doc_names[i],
+                        "chunk": int(self.chunk_idxs[i]),
+                        "score": float(s),
+                        "text": self.chunk_texts[i],
+                    })
+                self._query_cache[key] = results
+                found[key] = results
 
-        results = sorted(results, key=lambda r: r["score"], reverse=True)
-        self._query_cache[query] = results
-        return results
+        return [found[key] for key in keys]
 
     def _build_prompt(self, query, retrieved, top_n=2):
         """
@@ -81,95 +334,203 @@ class MiniRAG:
             snippets.append(f"{header}\n{r['text']}")
         context = "\n\n".join(snippets)
 
-        prompt = (
-            "You are a precise assistant. Use ONLY the provided document snippets below and nothing else.\n\n"
-            f"Context:\n{context}\n\n"
-            f"Question: {query}\n\n"
-            "Answer VERY CONCISELY in 1 or 2 short sentences, only using facts supported by the snippets. "
-            "Do NOT add any information that is not present. "
-            "If the answer is not present in the snippets, reply exactly: \"I couldn't find the answer in the documents.\" "
-            "At the end, append a single 'Sources:' line listing the snippet headers you used (comma-separated), e.g. Sources: doc1.md#chunk0.\n"
-        )
-        return prompt
+        return PROMPT_TEMPLATE.format(context=context, query=query)
 
-    def _call_ollama(self, prompt, max_tokens=256):
+    def _answer_key(self, query, retrieved, top_n=2):
         """
-        Call local Ollama HTTP API. Returns the textual response (string).
-        Raises RuntimeError on failure.
+        Cache key for a generated answer: the normalized query plus the ids of the
+        snippets that go into the prompt, so a re-index that changes them misses.
         """
-        url = f"{OLLAMA_URL}/api/generate"
-        payload = {
+        return (query_key(query), tuple((r["doc"], r["chunk"]) for r in retrieved[:top_n]))
+
+    def _ollama_payload(self, prompt, max_tokens):
+        return {
             "model": OLLAMA_MODEL,
             "prompt": prompt,
             "max_tokens": max_tokens,
             "temperature": 0.0,
-            "stream": False,
+            "stream": True,
         }
+
+    def _parse_ollama_line(self, line):
+        """
+        Decode one line of a streamed /api/generate response into a text fragment.
+        A server that ignores "stream" sends one full JSON body, which is parsed as before.
+        """
+        data = json.loads(line)
+        if isinstance(data, dict):
+            if "error" in data:
+                raise RuntimeError(data["error"])
+            if "done" in data:
+                return data.get("response") or ""
+        return self._parse_ollama_response(data)
+
+    def _parse_ollama_response(self, data):
+        """
+        Extract the textual response from an Ollama /api/generate JSON body.
+        """
+        # preferred locations for the textual response
+        if isinstance(data, dict):
+            if "response" in data and isinstance(data["response"], str):
+                return data["response"].strip()
+            if "results" in data and isinstance(data["results"], list):
+                parts = []
+                for r in data["results"]:
+                    if isinstance(r, dict):
+                        for k in ("response", "content", "text"):
+                            if k in r and isinstance(r[k], str):
+                                parts.append(r[k].strip())
+                if parts:
+                    return "\n\n".join(parts)
+        # fallback: return stringified data
+        return str(data)
+
+    def _stream_ollama(self, prompt, max_tokens=256):
+        """
+        Call local Ollama HTTP API with streaming on, yielding text fragments as they arrive.
+        Raises RuntimeError on failure.
+        """
+        url = f"{OLLAMA_URL}/api/generate"
+        try:
+            with self._http.post(
+                url, json=self._ollama_payload(prompt, max_tokens), timeout=OLLAMA_TIMEOUT, stream=True
+            ) as resp:
+                resp.raise_for_status()
+                for line in resp.iter_lines():
+                    if line:
+                        yield self._parse_ollama_line(line)
+        except Exception as e:
+            raise RuntimeError(f"Ollama call failed: {e}")
+
+    def _call_ollama(self, prompt, max_tokens=256):
+        """
+        Call local Ollama HTTP API. Returns the textual response (string).
+        Raises RuntimeError on failure.
+        """
+        return "".join(self._stream_ollama(prompt, max_tokens)).strip()
+
+    async def _astream_ollama(self, prompt, max_tokens=256):
+        """
+        Async variant of _stream_ollama using the shared keep-alive httpx client.
+        Raises RuntimeError on failure.
+        """
+        url = f"{OLLAMA_URL}/api/generate"
         try:
-            resp = requests.post(url, json=payload, timeout=OLLAMA_TIMEOUT)
-            resp.raise_for_status()
-            data = resp.json()
-
-            # preferred locations for the textual response
-            if isinstance(data, dict):
-                if "response" in data and isinstance(data["response"], str):
-                    return data["response"].strip()
-                if "results" in data and isinstance(data["results"], list):
-                    parts = []
-                    for r in data["results"]:
-                        if isinstance(r, dict):
-                            for k in ("response", "content", "text"):
-                                if k in r and isinstance(r[k], str):
-                                    parts.append(r[k].strip())
-                    if parts:
-                        return "\n\n".join(parts)
-            # fallback: return stringified data
-            return str(data)
+            async with self._ahttp.stream("POST", url, json=self._ollama_payload(prompt, max_tokens)) as resp:
+                resp.raise_for_status()
+                async for line in resp.aiter_lines():
+                    if line:
+                        yield self._parse_ollama_line(line)
         except Exception as e:
             raise RuntimeError(f"Ollama call failed: {e}")
 
-    def ask(self, query):
+    def _format_answer(self, raw, retrieved):
+        """
+        Post-process the raw LLM output: dedupe lines, ensure a Sources line, cap length.
+        """
+        # Normalize and deduplicate lines
+        lines = [ln.strip() for ln in raw.splitlines() if ln.strip()]
+        normalized = []
+        prev = None
+        for ln in lines:
+            if ln == prev:
+                continue
+            normalized.append(ln)
+            prev = ln
+        text = " ".join(normalized)
+
+        # Ensure there's a Sources: line; if not, append a short one
+        if "Sources:" not in text:
+            srcs = [f"{r['doc']}#chunk{r['chunk']}" for r in retrieved[:2]]
+            text = f"{text}\n\nSources: {', '.join(srcs)}"
+
+        # Enforce a safe length cap
+        if len(text) > 1000:
+            text = text[:950].rsplit(" ", 1)[0] + "..."
+
+        return text
+
+    def _fallback_answer(self, retrieved):
+        """
+        Ollama failed: return short snippet fallback.
+        """
+        top = retrieved[0]
+        snippet = top["text"].strip()
+        if len(snippet) > 400:
+            snippet = snippet[:400].rsplit(" ", 1)[0] + "..."
+        src = f"{top['doc']}#chunk{top['chunk']}"
+        return f" Ollama unavailable — returning best snippet instead.\n\n{snippet}\n\nSources: {src}"
+
+    def ask(self, query, retrieved=None):
         """
         Full RAG flow: retrieve -> build strict prompt (top 1-2) -> call Ollama -> post-process.
         If Ollama fails, fallback to returning the best snippet (short).
+        Pass `retrieved` to reuse results from an earlier retrieve_batch() call.
         """
-        retrieved = self.retrieve(query)
+        if retrieved is None:
+            retrieved = self.retrieve(query)
         if not retrieved:
             return "I couldn't find the answer in the documents."
 
+        key = self._answer_key(query, retrieved)
+        cached = self._answer_cache.get(key)
+        if cached is not None:
+            return cached
+
         # Build prompt using only top_n snippets (1 or 2 recommended)
         prompt = self._build_prompt(query, retrieved, top_n=2)
 
         try:
-            raw = self._call_ollama(prompt)
-
-            # Normalize and deduplicate lines
-            lines = [ln.strip() for ln in raw.splitlines() if ln.strip()]
-            normalized = []
-            prev = None
-            for ln in lines:
-                if ln == prev:
-                    continue
-                normalized.append(ln)
-                prev = ln
-            text = " ".join(normalized)
-
-            # Ensure there's a Sources: line; if not, append a short one
-            if "Sources:" not in text:
-                srcs = [f"{r['doc']}#chunk{r['chunk']}" for r in retrieved[:2]]
-                text = f"{text}\n\nSources: {', '.join(srcs)}"
-
-            # Enforce a safe length cap
-            if len(text) > 1000:
-                text = text[:950].rsplit(" ", 1)[0] + "..."
-
-            return text
+            answer = self._format_answer(self._call_ollama(prompt), retrieved)
+        except Exception:
+            return self._fallback_answer(retrieved)
 
+        self._answer_cache[key] = answer
+        return answer
+
+    async def astream(self, query, retrieved=None):
+        """
+        Streaming variant of ask(): yields the raw answer accumulated so far as Ollama
+        generates it, and finally the post-processed answer (or the snippet fallback).
+        Retrieval runs in a worker thread and the Ollama call goes through the shared
+        httpx.AsyncClient, so the event loop stays free.
+        """
+        if retrieved is None:
+            retrieved = await asyncio.to_thread(self.retrieve, query)
+        if not retrieved:
+            yield "I couldn't find the answer in the documents."
+            return
+
+        key = self._answer_key(query, retrieved)
+        cached = self._answer_cache.get(key)
+        if cached is not None:
+            yield cached
+            return
+
+        prompt = self._build_prompt(query, retrieved, top_n=2)
+
+        parts = []
+        try:
+            async for fragment in self._astream_ollama(prompt):
+                parts.append(fragment)
+                yield "".join(parts).strip()
         except Exception:
-            # Ollama failed: return short snippet fallback
-            top = retrieved[0]
-            snippet = top["text"].strip()
-            if len(snippet) > 400:
-                snippet = snippet[:400].rsplit(" ", 1)[0] + "..."
-            src = f"{top['doc']}#chunk{top['chunk']}"
-            return f" Ollama unavailable — returning best snippet instead.\n\n{snippet}\n\nSources: {src}"
+            yield self._fallback_answer(retrieved)
+            return
+
+        answer = self._format_answer("".join(parts).strip(), retrieved)
+        self._answer_cache[key] = answer
+        yield answer
+
+    async def aask(self, query, retrieved=None):
+        """
+        Async variant of ask(): returns only the final answer from astream().
+        """
+        answer = None
+        async for answer in self.astream(query, retrieved=retrieved):
+            pass
+        return answer
+
+    async def aclose(self):
+        self._http.close()
+        await self._ahttp.aclose()